@@ -1,10 +1,29 @@
 from urllib.parse import quote
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import re
+from functools import lru_cache
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 BASE_URL = "https://api.cal.com"
+# Shared keep-alive session for all Cal.com calls; idempotent requests retry on gateway errors
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)))
+
+def json_loads(data):
+    """Decode JSON from str or bytes with orjson."""
+    return orjson.loads(data)
+
+def json_dumps(data):
+    """Serialize data as compact JSON text with orjson."""
+    return orjson.dumps(data).decode()
+
+def _dumps_pretty(data):
+    """Serialize data as indented JSON for debug logging."""
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
 
 def call_cal_api(method: str, endpoint: str, api_key: str, **kwargs):
     """Centralized Cal.com API caller – returns (data, error_text)"""
@@ -22,35 +41,51 @@ def call_cal_api(method: str, endpoint: str, api_key: str, **kwargs):
 
     logger.debug(f"Constructed URL: {url}")
     try:
-        response = requests.request(method, url, headers=effective_headers, params=params, **{k: v for k, v in kwargs.items() if k not in ['params', 'headers']})
-        response.raise_for_status()
-        data = response.json()
-        logger.debug(f"API response for {url}: {json.dumps(data, indent=2)}")
-        return data, None
+        response = SESSION.request(method, url, headers=effective_headers, params=params, **{k: v for k, v in kwargs.items() if k not in ['params', 'headers']})
     except requests.RequestException as e:
-        err_text = e.response.text if e.response else str(e)
+        logger.error(f"API error for {url}: {e}")
+        return None, f"Error retrieving data: {str(e)} (Status: N/A, Response: {e})"
+    # Check the status directly instead of raising, and read the error body only once
+    if not response.ok:
+        status = response.status_code
+        err_text = response.text
         logger.error(f"API error for {url}: {err_text}")
-        try:
-            error_json = e.response.json() if e.response and e.response.text else {}
-            logger.debug(f"Full error response: {json.dumps(error_json, indent=2)}")
-        except ValueError:
-            logger.debug(f"Full error response: {err_text}")
-        return None, f"Error retrieving data: {str(e)} (Status: {getattr(e.response, 'status_code', 'N/A')}, Response: {err_text})"
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                error_json = json_loads(err_text) if err_text else {}
+                logger.debug(f"Full error response: {_dumps_pretty(error_json)}")
+            except ValueError:
+                logger.debug(f"Full error response: {err_text}")
+        return None, f"Error retrieving data: {status} Error: {response.reason} for url: {response.url} (Status: {status}, Response: {err_text})"
+    try:
+        data = json_loads(response.content)
+    except ValueError as e:
+        logger.error(f"Invalid JSON response from {url}: {e}")
+        return None, f"Error retrieving data: invalid JSON response ({e})"
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"API response for {url}: {_dumps_pretty(data)}")
+    return data, None
 
+# One duration component, e.g. "30", "45 min", "1.5 hours" or each half of "1h30m"
+_DURATION_RE = re.compile(r"\s*([-+]?\d+(?:\.\d+)?)\s*(seconds?|secs?|s|minutes?|mins?|m|hours?|hrs?|h)?(?![a-z])", re.IGNORECASE)
+_UNIT_MINUTES = {"s": 1 / 60, "m": 1, "h": 60}
+
+@lru_cache(maxsize=256)
 def parse_duration(duration_str):
     """Parse duration string to minutes"""
     if not duration_str:
         return 30
-    duration_str = str(duration_str).lower().strip()
-    try:
-        if "second" in duration_str:
-            return max(1, int(duration_str.split()[0]) // 60)
-        elif "min" in duration_str or "minute" in duration_str:
-            return max(1, int(duration_str.split()[0]))
-        elif "hr" in duration_str or "hour" in duration_str:
-            return max(1, int(duration_str.split()[0]) * 60)
-        else:
-            return max(1, int(duration_str))
-    except (ValueError, IndexError):
+    duration_str = str(duration_str)
+    minutes, pos = 0, 0
+    while match := _DURATION_RE.match(duration_str, pos):
+        value, unit = match.groups()
+        if not unit and (pos or duration_str[match.end():].strip()):
+            break  # a bare number is only valid as the whole input, e.g. "30" but not "1 30"
+        if pos and value[0] in "+-":
+            break  # only the leading component may carry a sign
+        minutes += float(value) * _UNIT_MINUTES[unit[0].lower() if unit else "m"]
+        pos = match.end()
+    if not pos or duration_str[pos:].strip():  # nothing matched, or trailing text we don't understand
         logger.warning(f"Unknown duration: {duration_str}, defaulting to 30 minutes")
-        return 30
\ No newline at end of file
+        return 30
+    return max(1, int(minutes))
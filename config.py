@@ -1,14 +1,16 @@
 import os
 import streamlit as st
 from importlib.metadata import version
+from importlib.util import find_spec
+from packaging.version import Version
 from dotenv import load_dotenv
 import logging
-import requests
 import json
+from cal_utils import SESSION
 
-# Set up logging
+# Set up logging (INFO by default; set LOG_LEVEL=DEBUG for full API payload dumps)
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=logging.getLevelNamesMapping().get(os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),  # unknown names fall back to INFO
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
@@ -27,21 +29,31 @@ else:
 # Check Streamlit version compatibility
 required_streamlit = "1.51.0"
 installed_streamlit = version("streamlit")
-if installed_streamlit < required_streamlit:
+if Version(installed_streamlit) < Version(required_streamlit):
     st.error(f"Streamlit {installed_streamlit} detected. Please install {required_streamlit} or higher.")
     st.stop()
 
-# Conditional import for Secret Manager (only for production)
+# Secret Manager is only needed in production; check it is installed but defer the import to get_secret
 secret_manager_available = False
 if os.getenv("STREAMLIT_ENV", "local") != "local":
     try:
-        from google.cloud import secretmanager
-        secret_manager_available = True
-    except ImportError:
+        secret_manager_available = find_spec("google.cloud.secretmanager") is not None
+    except ModuleNotFoundError:
+        pass
+    if not secret_manager_available:
         st.error("google-cloud-secretmanager is required for production. Install it with pip.")
         st.stop()
 
 def get_secret(secret_id):
+    """Return the secret value, or None if it isn't set."""
+    try:
+        return _load_secret(secret_id)
+    except LookupError:
+        return None
+
+# Raises instead of returning None so a missing key isn't cached and is picked up once it is set
+@st.cache_resource(show_spinner=False)
+def _load_secret(secret_id):
     if os.getenv("STREAMLIT_ENV", "local") == "local":
         # Map secret_id to .env variable name
         env_var_map = {
@@ -53,11 +65,13 @@ def get_secret(secret_id):
         logger.info(f"Local mode: Attempted to load {secret_id} (env var: {env_var}) = {value[:10] + '...' if value else 'None'}")
         if value is None:
             logger.error(f"Failed to load {secret_id} (env var: {env_var}) from .env. Ensure it is set correctly.")
+            raise LookupError(secret_id)
         return value
     if not secret_manager_available:
         st.error("Secret Manager not available in production mode.")
         st.stop()
     try:
+        from google.cloud import secretmanager
         client = secretmanager.SecretManagerServiceClient()
         name = f"projects/livex-app/secrets/{secret_id}/versions/latest"
         response = client.access_secret_version(name=name)
@@ -84,6 +98,10 @@ EVENT_SLUG = EVENT_SLUG_RAW if EVENT_SLUG_RAW and EVENT_SLUG_RAW.strip() else "3
 
 APP_HOST = os.getenv("APP_HOST", "127.0.0.1" if os.getenv("STREAMLIT_ENV", "local") == "local" else "0.0.0.0")
 APP_PORT = os.getenv("APP_PORT", "5901" if os.getenv("STREAMLIT_ENV", "local") == "local" else os.getenv("PORT", "8080"))
+# Run the /v2/slots eventTypeId retry and next-week fallback concurrently (set to "false" to debug sequentially)
+PARALLEL_SLOT_FALLBACK = os.getenv("PARALLEL_SLOT_FALLBACK", "true").lower() != "false"
+# Stream OpenAI responses token by token (set to "false" to use the blocking call when debugging)
+STREAM_OPENAI = os.getenv("STREAM_OPENAI", "true").lower() != "false"
 
 # Debug logging for final values
 logger.info(f"Loaded OPENAI_API_KEY: {'Yes' if OPENAI_API_KEY else 'No'}")
@@ -93,6 +111,8 @@ logger.info(f"Loaded USERNAME: {USERNAME}")
 logger.info(f"Loaded EVENT_SLUG: {EVENT_SLUG}")
 logger.info(f"Loaded APP_HOST: {APP_HOST}")
 logger.info(f"Loaded APP_PORT: {APP_PORT}")
+logger.info(f"Loaded PARALLEL_SLOT_FALLBACK: {PARALLEL_SLOT_FALLBACK}")
+logger.info(f"Loaded STREAM_OPENAI: {STREAM_OPENAI}")
 
 # Validate required vars
 required_vars = {
@@ -110,6 +130,32 @@ if missing_vars:
 IS_LOCAL = os.getenv("STREAMLIT_ENV", "local") == "local"
 STATIC_BASE = "static/" if IS_LOCAL else "/app/static/"
 
+# Sidebar selectbox options (label -> value), built once per process rather than on every rerun
+TIMEZONE_OPTIONS = {
+    "PT (Pacific Time)": "America/Los_Angeles",
+    "MT (Mountain Time)": "America/Denver",
+    "CT (Central Time)": "America/Chicago",
+    "ET (Eastern Time)": "America/New_York",
+    "AKT (Alaska Time)": "America/Anchorage",
+    "HAT (Hawaii-Aleutian Time)": "Pacific/Honolulu",
+    "Chamorro Time (Guam)": "Pacific/Guam",
+    "Atlantic Time (Puerto Rico)": "America/Puerto_Rico"
+}
+TIMEZONE_KEYS = list(TIMEZONE_OPTIONS)
+STYLE_OPTIONS = {
+    "1 - Coral & Dark Gray": "1",
+    "2 - Orange & Gray": "2",
+    "3 - Blue & White Minimal": "3",
+    "4 - Green & Light Gray": "4",
+    "5 - Purple & Neutral": "5",
+    "6 - Yellow & Blue": "6",
+    "7 - Teal & White": "7",
+    "8 - Pink & Gray": "8",
+    "9 - Navy & Cream": "9",
+    "10 - Mint & Charcoal": "10"
+}
+STYLE_KEYS = list(STYLE_OPTIONS)
+
 tools = [
     {
         "type": "function",
@@ -179,29 +225,36 @@ tools = [
 def validate_cal_config():
     """Validate Cal.com configuration by checking event types."""
     try:
-        headers = {"Authorization": f"Bearer {CAL_API_KEY}", "Content-Type": "application/json"}
-        url = "https://api.cal.com/v2/event-types"
-        params = {
-            "username": USERNAME,
-            "cal-api-version": "2024-08-13"
-        }
-        logger.info(f"Validating Cal.com config with URL: {url}")
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        logger.debug(f"API response for event types: {json.dumps(data, indent=2)}")
-        event_types = data.get("data", {}).get("eventTypeGroups", [])
-        for group in event_types:
-            for event in group.get("eventTypes", []):
-                if event.get("slug") == EVENT_SLUG and event.get("userIds", []) and not event.get("hidden"):
-                    logger.info(f"Validated event slug {EVENT_SLUG} for username {USERNAME}")
-                    return True
-        logger.error(f"Event slug {EVENT_SLUG} or username {USERNAME} not found or hidden")
-        return False
+        return _check_cal_config(CAL_API_KEY, USERNAME, EVENT_SLUG)
     except Exception as e:
         logger.error(f"Error validating Cal.com config: {str(e)}")
         return False
 
+# Raises on any failure so only a successful check is cached; a network blip or bad
+# config is retried on the next rerun instead of being replayed for the whole TTL.
+# The config values are arguments so a changed .env never reuses a stale result.
+@st.cache_data(ttl=3600, show_spinner=False)
+def _check_cal_config(api_key, username, event_slug):
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    url = "https://api.cal.com/v2/event-types"
+    params = {
+        "username": username,
+        "cal-api-version": "2024-08-13"
+    }
+    logger.info(f"Validating Cal.com config with URL: {url}")
+    response = SESSION.get(url, headers=headers, params=params)
+    response.raise_for_status()
+    data = response.json()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"API response for event types: {json.dumps(data, indent=2)}")
+    event_types = data.get("data", {}).get("eventTypeGroups", [])
+    events_by_slug = {event.get("slug"): event for group in event_types for event in group.get("eventTypes", [])}
+    event = events_by_slug.get(event_slug)
+    if event and event.get("userIds", []) and not event.get("hidden"):
+        logger.info(f"Validated event slug {event_slug} for username {username}")
+        return True
+    raise LookupError(f"Event slug {event_slug} or username {username} not found or hidden")
+
 # Validate Cal.com configuration
 if not validate_cal_config():
     st.error(f"Invalid Cal.com configuration: Event slug {EVENT_SLUG} or username {USERNAME} not found.")
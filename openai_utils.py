@@ -1,12 +1,13 @@
-import openai
 import logging
 import os
-from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
 
 def initialize_openai_client():
     """Initialize and return the OpenAI client."""
+    # Deferred: the openai package is slow to import and only needed here
+    import openai
+    from dotenv import load_dotenv
     load_dotenv()
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -20,18 +21,59 @@ def initialize_openai_client():
         logger.error(f"Failed to initialize OpenAI client: {str(e)}")
         return None
 
-def call_openai_api(client, messages, tools, model="gpt-4o-mini", timeout=30):
-    """Call OpenAI chat completion API with the provided messages and tools."""
+def call_openai_api(client, messages, tools, model="gpt-4o-mini", timeout=30, stream=False):
+    """Call OpenAI chat completion API with the provided messages and tools.
+    With stream=True, returns the chunk iterator instead of the full response."""
     try:
+        extra = {"stream": True, "stream_options": {"include_usage": True}} if stream else {}
         response = client.chat.completions.create(
             model=model,
             messages=messages,
             tools=tools,
             tool_choice="auto",
-            timeout=timeout
+            timeout=timeout,
+            **extra
         )
         logger.info("OpenAI API call successful")
         return response
     except Exception as e:
         logger.error(f"Error in OpenAI API call: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+def completion_to_dict(response):
+    """Flatten a chat completion into {"content", "tool_calls", "usage"}."""
+    message = response.choices[0].message
+    return {
+        "content": message.content,
+        "tool_calls": [
+            {"id": tc.id, "type": "function", "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+            for tc in message.tool_calls or []
+        ],
+        "usage": getattr(response, "usage", None)
+    }
+
+def stream_chat_completion(stream, result):
+    """Yield content deltas from a streamed chat completion.
+    Fills `result` with the same shape as completion_to_dict once the stream is exhausted;
+    tool-call fragments are stitched together by their index."""
+    content = []
+    tool_calls = {}
+    result["usage"] = None
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            result["usage"] = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+            yield delta.content
+        for tc in delta.tool_calls or []:
+            call = tool_calls.setdefault(tc.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+            if tc.id:
+                call["id"] = tc.id
+            if tc.function:
+                call["function"]["name"] += tc.function.name or ""
+                call["function"]["arguments"] += tc.function.arguments or ""
+    result["content"] = "".join(content) or None
+    result["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
@@ -1,26 +1,32 @@
-from datetime import datetime, time as dt_time, timedelta
-from pytz import timezone, utc
-from dateutil import parser as dtparser
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+from functools import lru_cache
 import logging
 import streamlit as st
 
 logger = logging.getLogger(__name__)
-UTC = utc
+UTC = dt_timezone.utc
 MAX_DURATION_SECONDS = 31_536_000  # 1 year in seconds
 
-def parse_to_utc_iso(time_str):
+@lru_cache(maxsize=16)
+def _tz(name):
+    """Return the ZoneInfo for name, cached so each zone is loaded once."""
+    return ZoneInfo(name)
+
+def parse_to_utc_iso(time_str, now=None):
     """Parse a date/time string to UTC ISO 8601 (YYYY-MM-DDTHH:MM:SSZ).
-    Raises ValueError if invalid or in the past."""
+    Raises ValueError if invalid or in the past. Pass `now` to reuse the caller's clock reading."""
     try:
-        now_utc = datetime.now(UTC)
-        local_tz = timezone(st.session_state.timezone)
-        if st.session_state.timezone.split('/')[0] in time_str.upper():
-            dt = dtparser.parse(time_str).astimezone(local_tz)
-            dt_utc = dt.astimezone(UTC)
-        elif time_str.endswith("Z"):
-            dt_utc = dtparser.parse(time_str).astimezone(UTC)
-        else:
-            dt_utc = dtparser.parse(time_str).replace(tzinfo=local_tz).astimezone(UTC)
+        now_utc = now or datetime.now(UTC)
+        dt_utc = None
+        if len(time_str) == 20 and time_str.endswith("Z"):
+            # Canonical form the model emits; skip dateutil when it matches exactly.
+            try:
+                dt_utc = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=UTC)
+            except ValueError:
+                pass
+        if dt_utc is None:
+            dt_utc = _parse_with_dateutil(time_str)
         if dt_utc < now_utc:
             logger.warning(f"Parsed time {time_str} is in the past: {dt_utc}")
             raise ValueError("Time cannot be in the past")
@@ -29,11 +35,28 @@ def parse_to_utc_iso(time_str):
         logger.error(f"Failed to parse time {time_str}: {e}")
         raise ValueError(f"Invalid time format: {e}")
 
-def validate_date(date_str, default_date):
+def _parse_with_dateutil(time_str):
+    """General-purpose fallback for parse_to_utc_iso; returns an aware UTC datetime."""
+    # dateutil is imported on first use to keep app start-up fast
+    from dateutil import parser as dtparser
+    local_tz = _tz(st.session_state.timezone)
+    if st.session_state.timezone.split('/')[0] in time_str.upper():
+        dt = dtparser.parse(time_str).astimezone(local_tz)
+        return dt.astimezone(UTC)
+    if time_str.endswith("Z"):
+        return dtparser.parse(time_str).astimezone(UTC)
+    return dtparser.parse(time_str).replace(tzinfo=local_tz).astimezone(UTC)
+
+def validate_date(date_str, default_date, now=None):
     """Validate a YYYY-MM-DD date, return default if invalid or past."""
-    local_tz = timezone(st.session_state.timezone)
-    now_local = datetime.now(local_tz)
+    local_tz = _tz(st.session_state.timezone)
+    now_local = now.astimezone(local_tz) if now else datetime.now(local_tz)
     today_str = now_local.strftime("%Y-%m-%d")
+    return _validate_date(date_str, default_date, today_str)
+
+@lru_cache(maxsize=256)
+def _validate_date(date_str, default_date, today_str):
+    """Cached core of validate_date, keyed on the local date so results never go stale."""
     try:
         date_obj = datetime.strptime(date_str, "%Y-%m-%d")
         if date_str < today_str:
@@ -62,23 +85,35 @@ def validate_duration_seconds(seconds):
 def calculate_end_date(start_date, duration_seconds):
     """Calculate end_date from start_date and duration in seconds."""
     try:
-        local_tz = timezone(st.session_state.timezone)
+        local_tz = _tz(st.session_state.timezone)
         start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-        start_datetime = local_tz.localize(datetime.combine(start_date_obj, dt_time(0, 0, 0)))
+        start_datetime = datetime.combine(start_date_obj, dt_time(0, 0, 0), tzinfo=local_tz)
         end_datetime = start_datetime + timedelta(seconds=duration_seconds)
         return end_datetime.astimezone(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
     except ValueError as e:
         logger.error(f"Failed to calculate end_date from {start_date} + {duration_seconds} seconds: {e}")
         return start_date
 
-def utc_to_local_display(utc_time_str):
+def _parse_utc(utc_time_str):
+    """Parse a UTC ISO 8601 string with fromisoformat, using dateutil only for other formats."""
+    try:
+        return datetime.fromisoformat(utc_time_str.replace("Z", "+00:00"))
+    except ValueError:
+        from dateutil import parser as dtparser
+        return dtparser.parse(utc_time_str)
+
+def utc_to_local_display(utc_time_str, local_tz=None):
     """Convert UTC ISO 8601 to local timezone display format with UTC in parentheses."""
     try:
-        local_tz = timezone(st.session_state.timezone)
-        utc_time = dtparser.parse(utc_time_str)
-        local_time = utc_time.astimezone(local_tz)
+        local_tz = local_tz or _tz(st.session_state.timezone)
+        local_time = _parse_utc(utc_time_str).astimezone(local_tz)
         display = local_time.strftime("%m/%d/%Y %I:%M %p %Z")
         return f"{display} (UTC: {utc_time_str})"
     except ValueError as e:
         logger.error(f"Failed to convert {utc_time_str} to local timezone: {e}")
         return "N/A"
+
+def utc_to_local_display_batch(utc_time_strs):
+    """Convert a list of UTC ISO 8601 strings to local display format, resolving the timezone once."""
+    local_tz = _tz(st.session_state.timezone)
+    return [utc_to_local_display(s, local_tz) for s in utc_time_strs]